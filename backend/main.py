@@ -1,15 +1,24 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from typing import List, Optional
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from typing import Final, List, Optional, Tuple
+import asyncio
+import multiprocessing
 import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from dotenv import load_dotenv
 import uvicorn
 import logging
+import aiofiles
 
 from services.document_processor import DocumentProcessor
-from services.azure_openai import AzureOpenAIService
+from services.azure_openai import AzureOpenAIService, get_service
 from utils.vector_store import VectorStore
+from utils.cache import SingleFlightTTLCache
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -18,28 +27,101 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
-app = FastAPI(title="CIO Assistant API", version="1.0.0")
+app = FastAPI(title="CIO Assistant API", version="1.0.0", default_response_class=ORJSONResponse)
 
 # CORS middleware
+_ORIGINS = [
+    origin.strip()
+    for origin in os.getenv("CORS_ORIGINS", "http://localhost:3000,http://localhost:5173,http://127.0.0.1:5173").split(",")
+    if origin.strip()
+]
+
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["http://localhost:3000", "http://localhost:5173", "http://127.0.0.1:5173"],
+    allow_origins=_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST", "OPTIONS"],
+    allow_headers=["authorization", "content-type"],
+    max_age=86400,  # Let browsers cache preflight responses for a day
 )
 
-# Initialize services
-try:
+# Services are created once at startup; a misconfiguration fails startup instead of being retried
+document_processor: Optional[DocumentProcessor] = None
+azure_openai: Optional[AzureOpenAIService] = None
+vector_store: Optional[VectorStore] = None
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIRECTORY", "uploads")
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
+# Keep a copy of uploaded files on disk; otherwise they are parsed from memory
+PERSIST_UPLOADS = os.getenv("PERSIST_UPLOADS", "false").lower() == "true"
+# Larger uploads are streamed to a temp file for parsing rather than read into memory
+UPLOAD_MEMORY_LIMIT = 8 << 20  # 8 MiB
+
+# CPU-bound document parsing runs in worker processes, created at startup
+process_pool: Optional[ProcessPoolExecutor] = None
+# Workers are started from a clean server process rather than forked from one running threads
+_PROCESS_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+# Concurrent dashboard polls share one computation per key within the TTL
+brief_cache = SingleFlightTTLCache(ttl=300)
+forecast_cache = SingleFlightTTLCache(ttl=300, maxsize=128)
+
+UPLOAD_ERROR_SUGGESTION = "Please ensure the file is not corrupted, password-protected, or in an unsupported format. Supported formats: PDF, DOCX, XLSX, CSV, TXT"
+
+@app.on_event("startup")
+async def init_services():
+    global document_processor, azure_openai, vector_store
     document_processor = DocumentProcessor()
-    azure_openai = AzureOpenAIService()
+    azure_openai = get_service()
     vector_store = VectorStore()
     logger.info("Services initialized successfully")
-except Exception as e:
-    logger.error(f"Error initializing services: {e}")
-    document_processor = DocumentProcessor()
-    azure_openai = AzureOpenAIService()
-    vector_store = VectorStore()
+
+@app.on_event("startup")
+async def preload_tokenizer():
+    # The tokenizer may need a download, so it loads in the background instead of on a request.
+    # A daemon thread, as the download has no timeout and must not hold up shutdown.
+    if azure_openai is not None and azure_openai.is_configured:
+        threading.Thread(target=azure_openai.preload_encoding, name="tokenizer-preload", daemon=True).start()
+
+@app.on_event("startup")
+async def create_upload_dir():
+    # Create uploads directory if it doesn't exist
+    if PERSIST_UPLOADS:
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+@app.on_event("startup")
+async def start_process_pool():
+    global process_pool
+    process_pool = _create_process_pool()
+
+def _create_process_pool() -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(max_workers=os.cpu_count(), mp_context=multiprocessing.get_context(_PROCESS_START_METHOD))
+
+async def _parse_in_pool(file_path: str, content: Optional[bytes], stored_path: Optional[str]) -> str:
+    """Parse a file in the process pool, replacing the pool and retrying once if a worker died"""
+    global process_pool
+    loop = asyncio.get_running_loop()
+    pool = process_pool
+    try:
+        return await loop.run_in_executor(pool, document_processor.process_file, file_path, content, stored_path)
+    except BrokenProcessPool:
+        # A dead worker (native crash, OOM kill) breaks the whole pool; the first caller to notice replaces it
+        if process_pool is pool:
+            logger.warning("Document parsing worker died; restarting the process pool")
+            process_pool = _create_process_pool()
+            pool.shutdown(wait=False, cancel_futures=True)
+        # A file that kills its worker again fails on its own; later uploads get a fresh pool
+        return await loop.run_in_executor(process_pool, document_processor.process_file, file_path, content, stored_path)
+
+@app.on_event("shutdown")
+async def stop_process_pool():
+    if process_pool is not None:
+        process_pool.shutdown(wait=False, cancel_futures=True)
+
+@app.on_event("shutdown")
+async def close_clients():
+    if azure_openai is not None:
+        await azure_openai.aclose()
 
 @app.get("/")
 async def root():
@@ -49,61 +131,137 @@ async def root():
 async def health_check():
     return {
         "status": "healthy",
-        "azure_openai_configured": azure_openai.client is not None,
+        "azure_openai_configured": azure_openai.is_configured,
         "vector_store_ready": vector_store.is_trained
     }
 
+def _spool_to_temp_file(file: UploadFile) -> Tuple[str, int]:
+    """Copy an upload into a private temp directory under its own name, returning the path and size"""
+    # Keeping the original basename means parsed output names the file the user uploaded
+    temp_dir = tempfile.mkdtemp(prefix="upload-")
+    temp_path = os.path.join(temp_dir, os.path.basename(file.filename))
+    try:
+        with open(temp_path, "wb") as temp_file:
+            file.file.seek(0)
+            shutil.copyfileobj(file.file, temp_file, UPLOAD_CHUNK_SIZE)
+            return temp_path, temp_file.tell()
+    except Exception:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+
 @app.post("/upload")
 async def upload_files(files: List[UploadFile] = File(...)):
     """Upload and process multiple files"""
     try:
-        results = []
-        for file in files:
-            # Create uploads directory if it doesn't exist
-            os.makedirs("uploads", exist_ok=True)
-            
-            # Save uploaded file
-            file_path = f"uploads/{file.filename}"
-            
-            with open(file_path, "wb") as buffer:
+        # Parsed documents waiting to be indexed together, with their positions in results
+        to_index: List[tuple] = []
+        
+        async def _handle_one(position: int, file: UploadFile) -> dict:
+            stored_path = None
+            if PERSIST_UPLOADS:
+                # Stream uploaded file to disk without buffering it in memory. Each upload gets its own
+                # temp file, renamed into place once parsed, so same-named uploads never share a path.
+                file_path = os.path.join(UPLOAD_DIR, os.path.basename(file.filename))
+                fd, stored_path = tempfile.mkstemp(dir=UPLOAD_DIR, prefix=".upload-")
+                os.close(fd)
+                content = None
+                file_size = 0
+                
+                try:
+                    async with aiofiles.open(stored_path, "wb") as buffer:
+                        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                            await buffer.write(chunk)
+                            file_size += len(chunk)
+                except Exception:
+                    await asyncio.to_thread(os.remove, stored_path)
+                    raise
+            elif file.size is not None and file.size <= UPLOAD_MEMORY_LIMIT:
+                file_path = file.filename
                 content = await file.read()
-                buffer.write(content)
+                file_size = len(content)
+            else:
+                # Copy in fixed-size chunks so peak memory stays constant; the worker process reads the file by path
+                file_path, file_size = await asyncio.to_thread(_spool_to_temp_file, file)
+                content = None
             
             # Process file
             try:
-                logger.info(f"Processing file: {file.filename} (size: {len(content)} bytes)")
-                processed_content = document_processor.process_file(file_path)
+                logger.info(f"Processing file: {file.filename} (size: {file_size} bytes)")
+                processed_content = await _parse_in_pool(file_path, content, stored_path)
                 
                 if not processed_content or len(processed_content.strip()) < 10:
                     raise Exception(f"File appears to be empty or unreadable. Content length: {len(processed_content) if processed_content else 0}")
                 
-                # Add to vector store
-                vector_store.add_document(processed_content, file.filename)
+                if stored_path is not None:
+                    await asyncio.to_thread(os.replace, stored_path, file_path)
+                    stored_path = None
+                
+                # Indexed with the rest of the batch, so the index is rebuilt and saved once
+                to_index.append((position, processed_content, file.filename))
                 
-                results.append({
+                logger.info(f"Successfully processed file: {file.filename}")
+                
+                return {
                     "filename": file.filename,
                     "status": "processed",
                     "content_length": len(processed_content),
                     "preview": processed_content[:300] + "..." if len(processed_content) > 300 else processed_content,
-                    "file_size": len(content)
-                })
-                
-                logger.info(f"Successfully processed file: {file.filename}")
+                    "file_size": file_size
+                }
                 
             except Exception as e:
                 logger.error(f"Error processing file {file.filename}: {e}")
-                # Clean up the failed file
-                try:
-                    os.remove(file_path)
-                except:
-                    pass
-                results.append({
+                return {
                     "filename": file.filename,
                     "status": "error",
                     "error": str(e),
-                    "suggestion": "Please ensure the file is not corrupted, password-protected, or in an unsupported format. Supported formats: PDF, DOCX, XLSX, CSV, TXT",
-                    "file_size": len(content)
-                })
+                    "suggestion": UPLOAD_ERROR_SUGGESTION,
+                    "file_size": file_size
+                }
+            
+            finally:
+                # Clean up a failed file; only this upload's own temp copy is removed
+                if stored_path is not None:
+                    try:
+                        await asyncio.to_thread(os.remove, stored_path)
+                    except OSError:
+                        pass
+                # Unlinking can be slow on network-mounted temp dirs, so it stays off the event loop
+                if not PERSIST_UPLOADS and content is None:
+                    await asyncio.to_thread(shutil.rmtree, os.path.dirname(file_path), ignore_errors=True)
+        
+        # Read, save and parse all files concurrently
+        outcomes = await asyncio.gather(*[_handle_one(i, f) for i, f in enumerate(files)], return_exceptions=True)
+        
+        results = []
+        for file, outcome in zip(files, outcomes):
+            if isinstance(outcome, Exception):
+                logger.error(f"Error processing file {file.filename}: {outcome}")
+                outcome = {
+                    "filename": file.filename,
+                    "status": "error",
+                    "error": str(outcome),
+                    "suggestion": UPLOAD_ERROR_SUGGESTION
+                }
+            results.append(outcome)
+        
+        # Add every parsed file to the vector store in one batch
+        if to_index:
+            try:
+                await asyncio.to_thread(
+                    vector_store.add_documents_bulk,
+                    [(processed_content, filename, None) for _, processed_content, filename in to_index]
+                )
+            except Exception as e:
+                logger.error(f"Error indexing uploaded files: {e}")
+                for position, _, filename in to_index:
+                    results[position] = {
+                        "filename": filename,
+                        "status": "error",
+                        "error": str(e),
+                        "suggestion": UPLOAD_ERROR_SUGGESTION,
+                        "file_size": results[position].get("file_size")
+                    }
         
         return {"files": results, "status": "success"}
     
@@ -121,10 +279,10 @@ async def chat(message: dict):
             raise HTTPException(status_code=400, detail="Message is required")
         
         # Get relevant context from vector store
-        context = vector_store.search(user_message)
+        context = await vector_store.asearch(user_message)
         
-        # Generate AI response
-        response = azure_openai.generate_response(user_message, context)
+        # Generate AI response off the event loop so other requests keep being served
+        response = await asyncio.to_thread(azure_openai.generate_response, user_message, context)
         
         return {"response": response, "status": "success"}
     
@@ -132,34 +290,82 @@ async def chat(message: dict):
         logger.error(f"Chat error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/chat/stream")
+async def chat_stream(message: dict):
+    """Chat with AI assistant using RAG, streaming the response as it is generated"""
+    try:
+        user_message = message.get("message", "")
+        
+        if not user_message:
+            raise HTTPException(status_code=400, detail="Message is required")
+        
+        context = await vector_store.asearch(user_message)
+        
+        return StreamingResponse(
+            azure_openai.stream_response(user_message, context),
+            media_type="text/plain"
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Chat stream error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Mock data for now - would integrate with real systems.
+# Built once at import; the payload is never mutated after this point.
+_BRIEF_TEMPLATE: Final[dict] = {
+    "date": "2024-01-15",
+    "risks": [
+        {"title": "Server Capacity", "severity": "high", "description": "Approaching 85% capacity"},
+        {"title": "Security Patch", "severity": "medium", "description": "Pending updates for 12 systems"}
+    ],
+    "wins": [
+        {"title": "Migration Complete", "description": "Successfully migrated 50 applications"},
+        {"title": "Cost Savings", "description": "Achieved 15% reduction in cloud costs"}
+    ],
+    "blockers": [
+        {"title": "Budget Approval", "description": "Waiting for Q2 budget approval"},
+        {"title": "Vendor Response", "description": "Pending response from security vendor"}
+    ],
+    "metrics": {
+        "uptime": "99.8%",
+        "incidents": 3,
+        "resolved": 2,
+        "budget_utilization": "78%"
+    }
+}
+
+def _build_daily_brief() -> dict:
+    """Assemble the daily executive brief"""
+    return _BRIEF_TEMPLATE
+
+def _build_forecast(budget_increase, time_horizon, metric) -> dict:
+    """Assemble forecast scenarios for the given parameters"""
+    # Mock forecast data - would use real ML models
+    return {
+        "scenario": f"{budget_increase}% budget increase over {time_horizon} months",
+        "predictions": {
+            "performance_improvement": f"{budget_increase * 0.8}%",
+            "risk_reduction": f"{budget_increase * 0.6}%",
+            "cost_efficiency": f"{budget_increase * 0.4}%"
+        },
+        "confidence": "85%",
+        "recommendations": [
+            "Focus on infrastructure automation",
+            "Invest in security monitoring tools",
+            "Expand cloud migration efforts"
+        ]
+    }
+
 @app.get("/brief")
 async def get_daily_brief():
     """Generate daily executive brief"""
     try:
-        # Mock data for now - would integrate with real systems
-        brief = {
-            "date": "2024-01-15",
-            "risks": [
-                {"title": "Server Capacity", "severity": "high", "description": "Approaching 85% capacity"},
-                {"title": "Security Patch", "severity": "medium", "description": "Pending updates for 12 systems"}
-            ],
-            "wins": [
-                {"title": "Migration Complete", "description": "Successfully migrated 50 applications"},
-                {"title": "Cost Savings", "description": "Achieved 15% reduction in cloud costs"}
-            ],
-            "blockers": [
-                {"title": "Budget Approval", "description": "Waiting for Q2 budget approval"},
-                {"title": "Vendor Response", "description": "Pending response from security vendor"}
-            ],
-            "metrics": {
-                "uptime": "99.8%",
-                "incidents": 3,
-                "resolved": 2,
-                "budget_utilization": "78%"
-            }
-        }
+        async def _generate():
+            return _build_daily_brief()
         
-        return brief
+        return await brief_cache.get_or_compute("daily", _generate)
     
     except Exception as e:
         logger.error(f"Brief generation error: {e}")
@@ -173,23 +379,11 @@ async def generate_forecast(params: dict):
         time_horizon = params.get("time_horizon", 12)
         metric = params.get("metric", "performance")
         
-        # Mock forecast data - would use real ML models
-        forecast = {
-            "scenario": f"{budget_increase}% budget increase over {time_horizon} months",
-            "predictions": {
-                "performance_improvement": f"{budget_increase * 0.8}%",
-                "risk_reduction": f"{budget_increase * 0.6}%",
-                "cost_efficiency": f"{budget_increase * 0.4}%"
-            },
-            "confidence": "85%",
-            "recommendations": [
-                "Focus on infrastructure automation",
-                "Invest in security monitoring tools",
-                "Expand cloud migration efforts"
-            ]
-        }
+        async def _generate():
+            return _build_forecast(budget_increase, time_horizon, metric)
         
-        return forecast
+        key = (repr(budget_increase), repr(time_horizon), repr(metric))
+        return await forecast_cache.get_or_compute(key, _generate)
     
     except Exception as e:
         logger.error(f"Forecast generation error: {e}")
@@ -197,4 +391,14 @@ async def generate_forecast(params: dict):
 
 if __name__ == "__main__":
     logger.info("Starting CIO Assistant API server...")
-    uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    # "auto" resolves to uvloop and httptools, which uvicorn[standard] installs where supported.
+    # Each worker holds its own in-memory vector store and caches, so the default is one worker.
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="auto",
+        http="auto",
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+        reload=os.getenv("DEV", "false").lower() == "true"
+    )
\ No newline at end of file
@@ -1,27 +1,174 @@
 import os
-from typing import List, Optional
-from openai import AzureOpenAI
+import asyncio
+import threading
+import time
+from functools import cached_property, lru_cache, wraps
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar, Union
+import httpx
+import tiktoken
+from openai import AzureOpenAI, AsyncAzureOpenAI, APIConnectionError, InternalServerError, RateLimitError
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
 import logging
 
+from services.embedding_cache import EmbeddingCache
+from services.gzip_transport import AsyncGzipRequestTransport, GzipRequestTransport
+from services.response_cache import ResponseCache
+
 logger = logging.getLogger(__name__)
 
+# Inputs per embeddings request, characters per request (~4 per token) and requests in flight at once
+EMBEDDING_BATCH_SIZE = int(os.getenv("AZURE_OPENAI_EMBEDDING_BATCH_SIZE", "128"))
+EMBEDDING_BATCH_CHARS = 400_000
+EMBEDDING_CONCURRENCY = 16
+# Azure rejects embeddings requests with more inputs than this
+EMBEDDING_MAX_BATCH_SIZE = 2048
+
+# Connection pool settings shared by the sync and async Azure clients
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=50)
+HTTP_TIMEOUT = httpx.Timeout(60.0, connect=5.0)
+# Gzip request bodies over 1 KB; off by default as not every gateway in front of Azure accepts it
+GZIP_REQUESTS = os.getenv("AZURE_OPENAI_GZIP_REQUESTS", "false").lower() == "true"
+
+# Per-deployment cap on concurrent Azure requests
+AZURE_CONCURRENCY = int(os.getenv("AZURE_CONCURRENCY", "20"))
+
+# Transient Azure failures (429, 5xx, connection drops) are retried with jittered exponential backoff
+_retry_transient = retry(
+    stop=stop_after_attempt(3),
+    wait=wait_random_exponential(min=0.5, max=8),
+    retry=retry_if_exception_type((RateLimitError, APIConnectionError, InternalServerError)),
+    reraise=True
+)
+
+T = TypeVar("T")
+
+def _locked_cached_property(func: Callable[["AzureOpenAIService"], T]) -> cached_property:
+    """cached_property whose value is built at most once, even on concurrent first access"""
+    name = func.__name__
+    
+    @wraps(func)
+    def _build(self):
+        # functools.cached_property takes no lock; store the value while holding ours
+        with self._build_lock:
+            if name not in self.__dict__:
+                self.__dict__[name] = func(self)
+            return self.__dict__[name]
+    
+    return cached_property(_build)
+
+async def _gather_with_retry(factories: List[Callable[[], Awaitable[T]]], limit: int = 10) -> List[Union[T, BaseException]]:
+    """Run independent Azure calls concurrently, at most limit at a time, retrying transient failures"""
+    semaphore = asyncio.Semaphore(limit)
+    
+    # The slot is released while backing off so other calls can proceed
+    @_retry_transient
+    async def _run(factory: Callable[[], Awaitable[T]]) -> T:
+        async with semaphore:
+            return await factory()
+    
+    # Failures are returned in place of results so one bad call does not discard the rest
+    return await asyncio.gather(*[_run(factory) for factory in factories], return_exceptions=True)
+
+# Input budget for summarization prompts
+SUMMARY_MAX_INPUT_TOKENS = 3500
+# Seconds a request waits on a tokenizer load in progress before truncating by characters instead
+TOKENIZER_WAIT_SECONDS = 5.0
+# Seconds before a failed tokenizer load is attempted again
+TOKENIZER_RETRY_SECONDS = 60.0
+
+# Kept byte-identical and first in every chat request so the provider's prompt prefix cache can reuse it
+SYSTEM_PROMPT = "You are a helpful CIO assistant that provides insights on IT management, strategy, and operations."
+
 class AzureOpenAIService:
     def __init__(self):
         self.api_key = os.getenv("AZURE_OPENAI_API_KEY")
         self.endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
         self.deployment_name = os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME", "gpt-4o")
         self.api_version = os.getenv("AZURE_OPENAI_API_VERSION", "2023-12-01-preview")
+        self.embedding_model = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+        # Stable end-user id so related requests route to the same prompt cache
+        self.cache_user = os.getenv("AZURE_OPENAI_CACHE_USER", "cio-assistant")
+        self.response_cache = ResponseCache()
+        # Tokenizer is preloaded at startup (or loaded on first use); its BPE ranks may need to be downloaded
+        self._encoding = None
+        self._encoding_lock = threading.Lock()
+        self._encoding_retry_at = 0.0
+        # Serializes lazy client construction; re-entrant as clients build their pools
+        self._build_lock = threading.RLock()
+        # Concurrency limits for the sync (threaded) and async request paths
+        self._sem = threading.BoundedSemaphore(AZURE_CONCURRENCY)
+        self._asem = asyncio.Semaphore(AZURE_CONCURRENCY)
         
-        if not self.api_key or not self.endpoint:
+        self.is_configured = bool(self.api_key and self.endpoint)
+        if not self.is_configured:
             logger.warning("Azure OpenAI credentials not configured")
-            self.client = None
-        else:
-            # Configure Azure OpenAI client
-            self.client = AzureOpenAI(
-                api_key=self.api_key,
-                api_version=self.api_version,
-                azure_endpoint=self.endpoint
-            )
+    
+    # Clients, connection pools and the embedding cache are built on first use, so
+    # processes that never call Azure (health checks, local parsing) never open them.
+    
+    @_locked_cached_property
+    def _http(self) -> Optional[httpx.Client]:
+        """Long-lived HTTP/2 keep-alive pool, avoiding a TCP + TLS handshake per request"""
+        if not self.is_configured:
+            return None
+        if GZIP_REQUESTS:
+            return httpx.Client(transport=GzipRequestTransport(http2=True, limits=HTTP_LIMITS), timeout=HTTP_TIMEOUT)
+        return httpx.Client(http2=True, limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+    
+    @_locked_cached_property
+    def client(self) -> Optional[AzureOpenAI]:
+        """Sync Azure OpenAI client; retries are handled by _retry_transient, so the SDK's own are disabled"""
+        if not self.is_configured:
+            return None
+        return AzureOpenAI(
+            api_key=self.api_key,
+            api_version=self.api_version,
+            azure_endpoint=self.endpoint,
+            http_client=self._http,
+            max_retries=0
+        )
+    
+    @_locked_cached_property
+    def _ahttp(self) -> Optional[httpx.AsyncClient]:
+        """Async HTTP/2 keep-alive pool for fanning out concurrent requests"""
+        if not self.is_configured:
+            return None
+        if GZIP_REQUESTS:
+            return httpx.AsyncClient(transport=AsyncGzipRequestTransport(http2=True, limits=HTTP_LIMITS), timeout=HTTP_TIMEOUT)
+        return httpx.AsyncClient(http2=True, limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+    
+    @_locked_cached_property
+    def aclient(self) -> Optional[AsyncAzureOpenAI]:
+        """Async Azure OpenAI client over the async pool"""
+        if not self.is_configured:
+            return None
+        return AsyncAzureOpenAI(
+            api_key=self.api_key,
+            api_version=self.api_version,
+            azure_endpoint=self.endpoint,
+            http_client=self._ahttp,
+            max_retries=0
+        )
+    
+    @_locked_cached_property
+    def embedding_cache(self) -> Optional[EmbeddingCache]:
+        """Embeddings of previously seen texts, reused instead of re-requested"""
+        if not self.is_configured:
+            return None
+        return EmbeddingCache(os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache.sqlite3"))
+    
+    async def aclose(self):
+        """Close pooled HTTP connections that have been opened"""
+        # Read instance state directly so closing never builds a client just to close it
+        http = self.__dict__.get("_http")
+        if http is not None:
+            http.close()
+        ahttp = self.__dict__.get("_ahttp")
+        if ahttp is not None:
+            await ahttp.aclose()
+        embedding_cache = self.__dict__.get("embedding_cache")
+        if embedding_cache is not None:
+            embedding_cache.close()
     
     def generate_response(self, message: str, context: Optional[str] = None) -> str:
         """Generate AI response using GPT-4o with optional context"""
@@ -29,45 +176,180 @@ class AzureOpenAIService:
             if not self.client:
                 return "Azure OpenAI is not configured. Please set up your API credentials."
             
-            # Prepare system message with context
-            system_message = "You are a helpful CIO assistant that provides insights on IT management, strategy, and operations."
-            if context:
-                system_message += f"\n\nRelevant context from uploaded documents:\n{context}"
-            
-            messages = [
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": message}
-            ]
+            # Repeated questions against the same context are served from cache
+            cached_response = self.response_cache.get(message, context)
+            if cached_response is not None:
+                return cached_response
             
-            response = self.client.chat.completions.create(
+            messages = self._chat_messages(message, context)
+            response = self._create_chat(
                 model=self.deployment_name,
                 messages=messages,
                 max_tokens=1000,
-                temperature=0.7
+                temperature=0.7,
+                user=self.cache_user
             )
             
-            return response.choices[0].message.content
+            choice = response.choices[0]
+            content = choice.message.content
+            # Truncated or filtered completions are returned but not cached
+            if content and choice.finish_reason == "stop":
+                self.response_cache.put(message, context, content)
+            return content
         
         except Exception as e:
             logger.error(f"Error generating AI response: {str(e)}")
             return f"I apologize, but I encountered an error while processing your request: {str(e)}"
     
-    def generate_embeddings(self, text: str) -> List[float]:
-        """Generate embeddings for text using Azure OpenAI"""
+    async def stream_response(self, message: str, context: Optional[str] = None) -> AsyncIterator[str]:
+        """Stream an AI response token by token as the completion is generated"""
         try:
-            if not self.client:
-                return []
+            if not self.aclient:
+                yield "Azure OpenAI is not configured. Please set up your API credentials."
+                return
             
-            response = self.client.embeddings.create(
-                model="text-embedding-ada-002",
-                input=text
-            )
+            cached_response = self.response_cache.get(message, context)
+            if cached_response is not None:
+                yield cached_response
+                return
             
-            return response.data[0].embedding
+            messages = self._chat_messages(message, context)
+            parts: List[str] = []
+            finish_reason = None
+            # The concurrency slot is held until the stream is fully drained
+            async with self._asem:
+                stream = await self._acreate_chat(
+                    model=self.deployment_name,
+                    messages=messages,
+                    max_tokens=1000,
+                    temperature=0.7,
+                    user=self.cache_user,
+                    stream=True
+                )
+                async for chunk in stream:
+                    # Azure sends a leading chunk with no choices carrying content filter results
+                    if not chunk.choices:
+                        continue
+                    finish_reason = chunk.choices[0].finish_reason or finish_reason
+                    delta = chunk.choices[0].delta.content or ""
+                    if delta:
+                        parts.append(delta)
+                        yield delta
+            
+            # Only completions that ran to a natural stop are cached; a filtered or cut-off stream is not
+            if parts and finish_reason == "stop":
+                self.response_cache.put(message, context, "".join(parts))
         
         except Exception as e:
-            logger.error(f"Error generating embeddings: {str(e)}")
-            return []
+            logger.error(f"Error streaming AI response: {str(e)}")
+            yield f"I apologize, but I encountered an error while processing your request: {str(e)}"
+    
+    async def generate_embeddings(self, texts: Union[str, List[str]], batch_size: int = EMBEDDING_BATCH_SIZE) -> Union[List[float], List[List[float]]]:
+        """Generate embeddings for one text or a list of texts using concurrent, length-sorted Azure OpenAI batches"""
+        if isinstance(texts, str):
+            return (await self.generate_embeddings([texts], batch_size))[0]
+        
+        if not self.aclient or not texts:
+            return [[] for _ in texts]
+        
+        # Repeated texts (boilerplate headers, footers) are embedded once and scattered back
+        unique, order = self._unique_texts(texts)
+        if len(unique) < len(texts):
+            vectors = await self.generate_embeddings(unique, batch_size)
+            return [vectors[i] for i in order]
+        
+        embeddings: List[List[float]] = [[] for _ in texts]
+        cached = await asyncio.to_thread(self.embedding_cache.get_many, self.embedding_model, texts)
+        for i, embedding in cached.items():
+            embeddings[i] = embedding
+        
+        # Only non-empty texts without a cached embedding are sent to Azure
+        missing = [i for i in range(len(texts)) if i not in cached and texts[i]]
+        if not missing:
+            return embeddings
+        
+        missing_texts = [texts[i] for i in missing]
+        batches = self._length_sorted_batches(missing_texts, min(batch_size, EMBEDDING_MAX_BATCH_SIZE))
+        
+        def _embed_batch(batch: List[int]) -> Callable[[], Awaitable]:
+            return lambda: self._create_embeddings(
+                model=self.embedding_model,
+                input=[missing_texts[j] for j in batch]
+            )
+        
+        responses = await _gather_with_retry([_embed_batch(batch) for batch in batches], limit=EMBEDDING_CONCURRENCY)
+        
+        results: List[List[List[float]]] = []
+        for batch, response in zip(batches, responses):
+            if isinstance(response, BaseException):
+                logger.error(f"Error generating embeddings: {str(response)}")
+                results.append([[] for _ in batch])
+            else:
+                # Order by the response's own index rather than trusting list order
+                results.append([item.embedding for item in sorted(response.data, key=lambda item: item.index)])
+        
+        # Scatter each embedding back to the position of its input text
+        fresh: Dict[str, List[float]] = {}
+        for batch, batch_embeddings in zip(batches, results):
+            for j, embedding in zip(batch, batch_embeddings):
+                embeddings[missing[j]] = embedding
+                if embedding:
+                    fresh[missing_texts[j]] = embedding
+        
+        await asyncio.to_thread(self.embedding_cache.put_many, self.embedding_model, fresh)
+        return embeddings
+    
+    @_retry_transient
+    def _create_chat(self, **kwargs):
+        """Create a chat completion within the concurrency limit, retrying transient failures"""
+        with self._sem:
+            return self.client.chat.completions.create(**kwargs)
+    
+    @_retry_transient
+    async def _acreate_chat(self, **kwargs):
+        """Create an async chat completion, retrying transient failures; callers hold the concurrency limit"""
+        return await self.aclient.chat.completions.create(**kwargs)
+    
+    @staticmethod
+    def _chat_messages(message: str, context: Optional[str]) -> List[dict]:
+        """Build chat messages: constant system prompt first, then the per-request context, then the user turn"""
+        messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+        if context:
+            messages.append({"role": "system", "content": f"Relevant context from uploaded documents:\n{context}"})
+        messages.append({"role": "user", "content": message})
+        return messages
+    
+    async def _create_embeddings(self, **kwargs):
+        """Create embeddings within the concurrency limit; callers retry via _gather_with_retry"""
+        async with self._asem:
+            return await self.aclient.embeddings.create(**kwargs)
+    
+    @staticmethod
+    def _unique_texts(texts: List[str]) -> Tuple[List[str], List[int]]:
+        """Return the distinct texts in first-seen order and each input's position among them"""
+        positions: Dict[str, int] = {}
+        order = [positions.setdefault(text, len(positions)) for text in texts]
+        return list(positions), order
+    
+    @staticmethod
+    def _length_sorted_batches(texts: List[str], batch_size: int, max_chars: int = EMBEDDING_BATCH_CHARS) -> List[List[int]]:
+        """Split text indices into batches of contiguous lengths, bounded by count and total characters"""
+        # Sorting by length keeps the provider from padding short inputs up to one long text
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        
+        batches: List[List[int]] = []
+        batch: List[int] = []
+        batch_chars = 0
+        for i in order:
+            if batch and (len(batch) >= batch_size or batch_chars + len(texts[i]) > max_chars):
+                batches.append(batch)
+                batch, batch_chars = [], 0
+            batch.append(i)
+            batch_chars += len(texts[i])
+        
+        if batch:
+            batches.append(batch)
+        return batches
     
     def generate_summary(self, text: str, max_length: int = 200) -> str:
         """Generate a summary of the provided text"""
@@ -80,10 +362,10 @@ class AzureOpenAIService:
                     "role": "system", 
                     "content": f"Summarize the following text in no more than {max_length} words. Focus on key insights and actionable information."
                 },
-                {"role": "user", "content": text}
+                {"role": "user", "content": self._truncate_tokens(text, SUMMARY_MAX_INPUT_TOKENS)}
             ]
             
-            response = self.client.chat.completions.create(
+            response = self._create_chat(
                 model=self.deployment_name,
                 messages=messages,
                 max_tokens=max_length * 2,  # Rough token estimate
@@ -94,4 +376,52 @@ class AzureOpenAIService:
         
         except Exception as e:
             logger.error(f"Error generating summary: {str(e)}")
-            return f"Summary generation failed: {str(e)}"
\ No newline at end of file
+            return f"Summary generation failed: {str(e)}"
+    
+    def preload_encoding(self):
+        """Load the tokenizer ahead of the first request that needs it"""
+        self._get_encoding(timeout=None)
+    
+    def _get_encoding(self, timeout: Optional[float] = TOKENIZER_WAIT_SECONDS) -> Optional[tiktoken.Encoding]:
+        """Return the tokenizer for the chat model, or None if it cannot be loaded in time"""
+        if self._encoding is not None:
+            return self._encoding
+        if time.monotonic() < self._encoding_retry_at:
+            return None
+        
+        # One load at a time; callers wait at most timeout for a download already in progress
+        if not self._encoding_lock.acquire(timeout=-1 if timeout is None else timeout):
+            logger.warning("Tokenizer still loading, falling back to character truncation")
+            return None
+        try:
+            if self._encoding is None and time.monotonic() >= self._encoding_retry_at:
+                try:
+                    try:
+                        encoding = tiktoken.encoding_for_model(self.deployment_name)
+                    except KeyError:
+                        # Deployment names need not match model names; gpt-4o family uses o200k_base
+                        encoding = tiktoken.get_encoding("o200k_base")
+                    # Published only once fully loaded; a failed load is retried after TOKENIZER_RETRY_SECONDS
+                    self._encoding = encoding
+                except Exception as e:
+                    logger.warning(f"Tokenizer unavailable, falling back to character truncation: {str(e)}")
+                    self._encoding_retry_at = time.monotonic() + TOKENIZER_RETRY_SECONDS
+            return self._encoding
+        finally:
+            self._encoding_lock.release()
+    
+    def _truncate_tokens(self, text: str, max_tokens: int) -> str:
+        """Truncate text to at most max_tokens tokens"""
+        encoding = self._get_encoding()
+        if encoding is None:
+            return text[:max_tokens * 4]  # Rough characters-per-token estimate
+        
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        return encoding.decode(tokens[:max_tokens])
+
+@lru_cache(maxsize=1)
+def get_service() -> AzureOpenAIService:
+    """Return the process-wide AzureOpenAIService, sharing one set of pooled clients"""
+    return AzureOpenAIService()
@@ -1,6 +1,8 @@
+import io
 import os
+import mmap
 import logging
-from typing import Dict, List, Optional
+from typing import BinaryIO, Dict, Iterator, List, Optional, Union
 import PyPDF2
 import docx
 import pandas as pd
@@ -8,206 +10,305 @@ from openpyxl import load_workbook
 
 logger = logging.getLogger(__name__)
 
+# Numeric statistics for CSVs above this many rows are computed on a fixed-seed sample
+CSV_STATS_MAX_ROWS = 100_000
+CSV_STATS_SAMPLE_ROWS = 10_000
+
+# pyarrow parses CSV multi-threaded in C++, several times faster than the default engine
+try:
+    import pyarrow  # noqa: F401
+    CSV_ENGINE = 'pyarrow'
+except ImportError:
+    CSV_ENGINE = 'c'
+
+# pypdfium2 wraps PDFium's native text extraction, several times faster per page than PyPDF2
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
+
+# python-calamine is a native XLSX reader, several times faster than openpyxl
+try:
+    import python_calamine  # noqa: F401
+    XLSX_ENGINE = 'calamine'
+except ImportError:
+    XLSX_ENGINE = 'openpyxl'
+
 class DocumentProcessor:
     def __init__(self):
-        self.supported_extensions = {'.pdf', '.docx', '.xlsx', '.csv', '.txt'}
+        # Extension -> extractor; also the set of supported extensions
+        self._handlers = {
+            '.pdf': self._process_pdf,
+            '.docx': self._process_docx,
+            '.xlsx': self._process_xlsx,
+            '.csv': self._process_csv,
+            '.txt': self._process_txt
+        }
+        self.supported_extensions = set(self._handlers)
     
-    def process_file(self, file_path: str) -> str:
-        """Process uploaded file and extract text content"""
+    def process_file(self, file_path: str, content: Optional[bytes] = None, stored_path: Optional[str] = None) -> str:
+        """Process uploaded file (or its in-memory content, or a copy stored elsewhere) and extract text content"""
         try:
             file_extension = os.path.splitext(file_path)[1].lower()
             
-            if file_extension not in self.supported_extensions:
+            handler = self._handlers.get(file_extension)
+            if handler is None:
                 raise ValueError(f"Unsupported file type: {file_extension}")
             
-            if file_extension == '.pdf':
-                return self._process_pdf(file_path)
-            elif file_extension == '.docx':
-                return self._process_docx(file_path)
-            elif file_extension == '.xlsx':
-                return self._process_xlsx(file_path)
-            elif file_extension == '.csv':
-                return self._process_csv(file_path)
-            elif file_extension == '.txt':
-                return self._process_txt(file_path)
+            # In-memory content or a stored copy is parsed directly; file_path then only supplies the name
+            if content is not None:
+                source = io.BytesIO(content)
+            else:
+                source = stored_path or file_path
+            
+            return handler(file_path, source)
             
         except Exception as e:
             logger.error(f"Error processing file {file_path}: {str(e)}")
             raise
     
-    def _process_pdf(self, file_path: str) -> str:
+    def _process_pdf(self, file_path: str, source: Union[str, BinaryIO]) -> str:
         """Extract text from PDF file"""
         try:
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                text = ""
-                
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-                
-                return text.strip()
+            if pdfium is not None:
+                try:
+                    return self._pdf_text_pdfium(source)
+                except Exception as pdfium_error:
+                    logger.warning(f"PDFium failed for {file_path}, falling back to PyPDF2: {pdfium_error}")
+                    if not isinstance(source, str):
+                        source.seek(0)
+            
+            pdf_reader = PyPDF2.PdfReader(source)
+            parts = [page.extract_text() for page in pdf_reader.pages]
+            
+            return "\n".join(parts).strip()
         
         except Exception as e:
             logger.error(f"Error processing PDF {file_path}: {str(e)}")
             return f"Error processing PDF: {str(e)}"
     
-    def _process_docx(self, file_path: str) -> str:
+    def stream_pdf(self, file_path: str, content: Optional[bytes] = None) -> Iterator[str]:
+        """Yield the text of a PDF (or its in-memory content) one page at a time"""
+        source = io.BytesIO(content) if content is not None else file_path
+        if pdfium is not None:
+            try:
+                pdf = pdfium.PdfDocument(source)
+            except Exception as e:
+                logger.warning(f"PDFium failed for {file_path}, falling back to PyPDF2: {str(e)}")
+                if not isinstance(source, str):
+                    source.seek(0)
+            else:
+                yield from self._pdfium_pages(pdf)
+                return
+        
+        for page in PyPDF2.PdfReader(source).pages:
+            yield page.extract_text()
+    
+    def _pdf_text_pdfium(self, source: Union[str, BinaryIO]) -> str:
+        """Extract text from every page of a PDF with PDFium"""
+        return "\n".join(self._pdfium_pages(pdfium.PdfDocument(source))).strip()
+    
+    def _pdfium_pages(self, pdf) -> Iterator[str]:
+        """Yield page texts from an open PDFium document, closing each page and then the document"""
+        # PDFium is not thread-safe, so pages are extracted sequentially
+        try:
+            for page in pdf:
+                textpage = page.get_textpage()
+                # PDFium separates lines with \r\n
+                yield textpage.get_text_bounded().replace('\r\n', '\n')
+                textpage.close()
+                page.close()
+        finally:
+            pdf.close()
+    
+    def _process_docx(self, file_path: str, source: Union[str, BinaryIO]) -> str:
         """Extract text from DOCX file"""
         try:
-            doc = docx.Document(file_path)
-            text = ""
-            
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
+            doc = docx.Document(source)
+            parts = [paragraph.text + "\n" for paragraph in doc.paragraphs]
             
             # Extract text from tables
             for table in doc.tables:
                 for row in table.rows:
-                    for cell in row.cells:
-                        text += cell.text + " "
-                    text += "\n"
+                    parts.append("".join(cell.text + " " for cell in row.cells) + "\n")
             
-            return text.strip()
+            return "".join(parts).strip()
         
         except Exception as e:
             logger.error(f"Error processing DOCX {file_path}: {str(e)}")
             return f"Error processing DOCX: {str(e)}"
     
-    def _process_xlsx(self, file_path: str) -> str:
+    def _process_xlsx(self, file_path: str, source: Union[str, BinaryIO]) -> str:
         """Extract data from XLSX file"""
         try:
             # First try with pandas (more robust for complex Excel files)
             try:
-                logger.info(f"Attempting to process Excel file with pandas: {file_path}")
-                df_dict = pd.read_excel(file_path, sheet_name=None, engine='openpyxl')
-                
-                text = f"Excel File: {os.path.basename(file_path)}\n"
-                text += f"Total Sheets: {len(df_dict)}\n\n"
-                
-                for sheet_name, sheet_df in df_dict.items():
-                    text += f"=== Sheet: {sheet_name} ===\n"
-                    text += f"Dimensions: {len(sheet_df)} rows × {len(sheet_df.columns)} columns\n"
-                    
-                    # Clean column names
-                    clean_columns = []
-                    for col in sheet_df.columns:
-                        if pd.isna(col):
-                            clean_columns.append("Unnamed_Column")
-                        else:
-                            clean_columns.append(str(col).strip())
-                    
-                    text += f"Columns: {', '.join(clean_columns[:10])}"
-                    if len(clean_columns) > 10:
-                        text += f" ... and {len(clean_columns) - 10} more"
-                    text += "\n\n"
-                    
-                    # Add sample data (first 5 rows)
-                    if not sheet_df.empty:
-                        text += "Sample Data (first 5 rows):\n"
-                        sample_df = sheet_df.head(5).fillna('')
-                        
-                        # Convert to string representation
-                        for idx, row in sample_df.iterrows():
-                            row_data = []
-                            for col_idx, value in enumerate(row):
-                                if col_idx >= 10:  # Limit columns
-                                    row_data.append("...")
-                                    break
-                                row_data.append(str(value)[:50])  # Limit cell content
-                            text += f"Row {idx + 1}: {' | '.join(row_data)}\n"
-                    else:
-                        text += "Sheet is empty\n"
-                    
-                    text += "\n"
-                
-                logger.info(f"Successfully processed Excel file with pandas: {file_path}")
-                return text.strip()
-                
-            except Exception as pandas_error:
+                return self._xlsx_pandas(file_path, source)
+            except Exception as e:
+                pandas_error = e
                 logger.warning(f"Pandas failed for {file_path}: {pandas_error}")
+            
+            # Fallback to openpyxl
+            try:
+                if not isinstance(source, str):
+                    source.seek(0)
+                return self._xlsx_openpyxl(file_path, source)
+            except Exception:
+                logger.error(f"Both pandas and openpyxl failed for {file_path}")
+            
+            # Try one more approach - basic file info
+            file_size = os.path.getsize(source) if isinstance(source, str) else source.getbuffer().nbytes
+            return f"Excel file detected but could not be processed.\nFile: {os.path.basename(file_path)}\nSize: {file_size} bytes\nError: {str(pandas_error)}\n\nPlease ensure the file is not password-protected, corrupted, or in an unsupported Excel format."
+        
+        except Exception as e:
+            logger.error(f"Error processing XLSX {file_path}: {str(e)}")
+            return f"Error processing XLSX: {str(e)}"
+    
+    def _xlsx_pandas(self, file_path: str, source: Union[str, BinaryIO]) -> str:
+        """Summarize every sheet of a workbook read with pandas"""
+        logger.info(f"Attempting to process Excel file with pandas: {file_path}")
+        df_dict = pd.read_excel(source, sheet_name=None, engine=XLSX_ENGINE)
+        
+        parts = [
+            f"Excel File: {os.path.basename(file_path)}\n",
+            f"Total Sheets: {len(df_dict)}\n\n"
+        ]
+        
+        for sheet_name, sheet_df in df_dict.items():
+            parts.append(f"=== Sheet: {sheet_name} ===\n")
+            parts.append(f"Dimensions: {len(sheet_df)} rows × {len(sheet_df.columns)} columns\n")
+            
+            # Clean column names
+            clean_columns = []
+            for col in sheet_df.columns:
+                if pd.isna(col):
+                    clean_columns.append("Unnamed_Column")
+                else:
+                    clean_columns.append(str(col).strip())
+            
+            parts.append(f"Columns: {', '.join(clean_columns[:10])}")
+            if len(clean_columns) > 10:
+                parts.append(f" ... and {len(clean_columns) - 10} more")
+            parts.append("\n\n")
+            
+            # Add sample data (first 5 rows)
+            if not sheet_df.empty:
+                parts.append("Sample Data (first 5 rows):\n")
+                sample_df = sheet_df.head(5).fillna('')
                 
-                # Fallback to openpyxl
-                try:
-                    logger.info(f"Attempting to process Excel file with openpyxl: {file_path}")
-                    workbook = load_workbook(file_path, read_only=True, data_only=True)
-                except Exception as openpyxl_error:
-                    logger.error(f"Both pandas and openpyxl failed for {file_path}")
-                    # Try one more approach - basic file info
-                    try:
-                        file_size = os.path.getsize(file_path)
-                        return f"Excel file detected but could not be processed.\nFile: {os.path.basename(file_path)}\nSize: {file_size} bytes\nError: {str(pandas_error)}\n\nPlease ensure the file is not password-protected, corrupted, or in an unsupported Excel format."
-                    except:
-                        return f"Excel file processing failed: {str(pandas_error)}"
-            
-            text = ""
+                # Convert to string representation
+                for idx, row in sample_df.iterrows():
+                    row_data = []
+                    for col_idx, value in enumerate(row):
+                        if col_idx >= 10:  # Limit columns
+                            row_data.append("...")
+                            break
+                        row_data.append(str(value)[:50])  # Limit cell content
+                    parts.append(f"Row {idx + 1}: {' | '.join(row_data)}\n")
+            else:
+                parts.append("Sheet is empty\n")
+            
+            parts.append("\n")
+        
+        logger.info(f"Successfully processed Excel file with pandas: {file_path}")
+        return "".join(parts).strip()
+    
+    def _xlsx_openpyxl(self, file_path: str, source: Union[str, BinaryIO]) -> str:
+        """Dump the non-empty rows of every sheet of a workbook read with openpyxl"""
+        logger.info(f"Attempting to process Excel file with openpyxl: {file_path}")
+        workbook = load_workbook(source, read_only=True, data_only=True)
+        
+        try:
+            parts = []
             
             for sheet_name in workbook.sheetnames:
                 sheet = workbook[sheet_name]
-                text += f"Sheet: {sheet_name}\n"
+                parts.append(f"Sheet: {sheet_name}")
                 
                 row_count = 0
                 for row in sheet.iter_rows(values_only=True):
                     if row_count > 1000:  # Limit rows to prevent memory issues
-                        text += "... (truncated for size)\n"
+                        parts.append("... (truncated for size)")
                         break
                     row_text = " | ".join([str(cell) if cell is not None else "" for cell in row])
                     if row_text.strip():  # Only add non-empty rows
-                        text += row_text + "\n"
+                        parts.append(row_text)
                     row_count += 1
                 
-                text += "\n"
+                parts.append("")
             
+            return "\n".join(parts).strip()
+        finally:
             workbook.close()
-            return text.strip()
-        
-        except Exception as e:
-            logger.error(f"Error processing XLSX {file_path}: {str(e)}")
     
-    def _process_csv(self, file_path: str) -> str:
+    def _process_csv(self, file_path: str, source: Union[str, BinaryIO]) -> str:
         """Extract data from CSV file"""
         try:
-            df = pd.read_csv(file_path)
+            try:
+                df = pd.read_csv(source, engine=CSV_ENGINE)
+            except Exception as engine_error:
+                if CSV_ENGINE == 'c':
+                    raise
+                logger.warning(f"pyarrow failed for {file_path}, falling back to the default CSV engine: {engine_error}")
+                if not isinstance(source, str):
+                    source.seek(0)
+                df = pd.read_csv(source)
             
             # Convert DataFrame to text representation
-            text = f"CSV Data Summary:\n"
-            text += f"Rows: {len(df)}, Columns: {len(df.columns)}\n\n"
-            text += f"Columns: {', '.join(df.columns)}\n\n"
-            
-            # Add first few rows as sample
-            text += "Sample Data:\n"
-            text += df.head(10).to_string(index=False)
+            parts = [
+                "CSV Data Summary:\n",
+                f"Rows: {len(df)}, Columns: {len(df.columns)}\n\n",
+                f"Columns: {', '.join(df.columns)}\n\n",
+                # Add first few rows as sample
+                "Sample Data:\n",
+                df.head(10).to_string(index=False)
+            ]
             
             # Add basic statistics for numeric columns
             numeric_cols = df.select_dtypes(include=['number']).columns
             if len(numeric_cols) > 0:
-                text += "\n\nNumeric Column Statistics:\n"
-                text += df[numeric_cols].describe().to_string()
+                numeric_df = df[numeric_cols]
+                if len(df) > CSV_STATS_MAX_ROWS:
+                    numeric_df = numeric_df.sample(n=CSV_STATS_SAMPLE_ROWS, random_state=0)
+                    parts.append(f"\n\nNumeric Column Statistics (sampled {CSV_STATS_SAMPLE_ROWS} of {len(df)} rows):\n")
+                else:
+                    parts.append("\n\nNumeric Column Statistics:\n")
+                parts.append(numeric_df.describe().to_string())
             
-            return text
+            return "".join(parts)
         
         except Exception as e:
             logger.error(f"Error processing CSV {file_path}: {str(e)}")
             return f"Error processing CSV: {str(e)}"
     
-    def _process_txt(self, file_path: str) -> str:
+    def _process_txt(self, file_path: str, source: Union[str, BinaryIO]) -> str:
         """Extract text from TXT file"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                return file.read()
-        
-        except UnicodeDecodeError:
-            # Try with different encoding
-            try:
-                with open(file_path, 'r', encoding='latin-1') as file:
-                    return file.read()
-            except Exception as e:
-                logger.error(f"Error processing TXT {file_path}: {str(e)}")
-                return f"Error processing TXT: {str(e)}"
+            if not isinstance(source, str):
+                return self._decode_text(source.getbuffer())
+            
+            # Map the file rather than reading it, so the bytes are decoded straight from the page cache
+            with open(source, 'rb') as file:
+                if os.fstat(file.fileno()).st_size == 0:
+                    return ""
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                        mapped.madvise(mmap.MADV_SEQUENTIAL)
+                    return self._decode_text(mapped)
         
         except Exception as e:
             logger.error(f"Error processing TXT {file_path}: {str(e)}")
             return f"Error processing TXT: {str(e)}"
     
+    def _decode_text(self, buffer) -> str:
+        """Decode a byte buffer as UTF-8, else Latin-1, with universal newlines"""
+        try:
+            text = str(buffer, 'utf-8')
+        except UnicodeDecodeError:
+            # Try with different encoding
+            text = str(buffer, 'latin-1')
+        return text.replace('\r\n', '\n').replace('\r', '\n')
+    
     def get_file_metadata(self, file_path: str) -> Dict:
         """Get metadata about the processed file"""
         try:
@@ -0,0 +1,78 @@
+import os
+import hashlib
+import sqlite3
+import threading
+import logging
+from typing import Dict, List
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# SQLite caps the number of bound parameters per statement
+_SELECT_CHUNK = 500
+
+class EmbeddingCache:
+    """Persistent embedding cache keyed by sha256(model | text), stored as float32 blobs in SQLite"""
+    
+    def __init__(self, path: str = "./embedding_cache.sqlite3"):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self._conn.commit()
+    
+    def get_many(self, model: str, texts: List[str]) -> Dict[int, List[float]]:
+        """Return cached embeddings for texts, keyed by position in texts"""
+        try:
+            keys = [self._key(model, text) for text in texts]
+            found: Dict[str, bytes] = {}
+            
+            with self._lock:
+                for start in range(0, len(keys), _SELECT_CHUNK):
+                    chunk = keys[start:start + _SELECT_CHUNK]
+                    placeholders = ",".join("?" * len(chunk))
+                    rows = self._conn.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                    ).fetchall()
+                    found.update(rows)
+            
+            return {
+                i: np.frombuffer(found[key], dtype=np.float32).tolist()
+                for i, key in enumerate(keys)
+                if key in found
+            }
+        
+        except Exception as e:
+            logger.error(f"Error reading embedding cache: {str(e)}")
+            return {}
+    
+    def put_many(self, model: str, embeddings: Dict[str, List[float]]):
+        """Store embeddings keyed by their input text"""
+        if not embeddings:
+            return
+        
+        try:
+            rows = [
+                (self._key(model, text), np.asarray(vector, dtype=np.float32).tobytes())
+                for text, vector in embeddings.items()
+            ]
+            with self._lock:
+                self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+                self._conn.commit()
+        
+        except Exception as e:
+            logger.error(f"Error writing embedding cache: {str(e)}")
+    
+    def close(self):
+        """Close the underlying database connection"""
+        with self._lock:
+            self._conn.close()
+    
+    @staticmethod
+    def _key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}|{text}".encode("utf-8")).hexdigest()
\ No newline at end of file
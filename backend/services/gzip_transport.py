@@ -0,0 +1,33 @@
+import gzip
+import httpx
+
+# Bodies smaller than this are not worth the compression cost
+GZIP_MIN_SIZE = 1024
+
+def _compress(request: httpx.Request, body: bytes):
+    """Replace a request body with its gzip encoding"""
+    compressed = gzip.compress(body, compresslevel=5)
+    request.headers["Content-Encoding"] = "gzip"
+    request.headers["Content-Length"] = str(len(compressed))
+    request.stream = httpx.ByteStream(compressed)
+
+def _should_compress(request: httpx.Request, body: bytes) -> bool:
+    return len(body) >= GZIP_MIN_SIZE and "Content-Encoding" not in request.headers
+
+class GzipRequestTransport(httpx.HTTPTransport):
+    """HTTP transport that gzips large request bodies"""
+    
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        body = request.read()
+        if _should_compress(request, body):
+            _compress(request, body)
+        return super().handle_request(request)
+
+class AsyncGzipRequestTransport(httpx.AsyncHTTPTransport):
+    """Async HTTP transport that gzips large request bodies"""
+    
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        if _should_compress(request, body):
+            _compress(request, body)
+        return await super().handle_async_request(request)
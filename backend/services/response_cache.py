@@ -0,0 +1,48 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+class ResponseCache:
+    """Cache of chat completions keyed by the exact (normalized message, context) pair"""
+    
+    def __init__(self, maxsize: int = 512):
+        self.maxsize = maxsize
+        # key -> response, oldest first. Near-duplicate matching is deliberately not attempted:
+        # lexically similar questions ("passed" vs "failed", "approve" vs "not approve") can need opposite answers.
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, message: str, context: Optional[str] = None) -> Optional[str]:
+        """Return a cached response for this message and context, if any"""
+        key = self._key(message, context)
+        
+        with self._lock:
+            response = self._entries.get(key)
+            if response is not None:
+                self._entries.move_to_end(key)
+            return response
+    
+    def put(self, message: str, context: Optional[str], response: str):
+        """Store a response for this message and context"""
+        key = self._key(message, context)
+        
+        with self._lock:
+            self._entries[key] = response
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        """Drop all cached responses"""
+        with self._lock:
+            self._entries.clear()
+    
+    @staticmethod
+    def _normalize(message: str) -> str:
+        return " ".join(message.lower().split())
+    
+    @classmethod
+    def _key(cls, message: str, context: Optional[str]) -> str:
+        context_hash = hashlib.blake2b((context or "").encode("utf-8"), digest_size=16).hexdigest()
+        return hashlib.blake2b(f"{cls._normalize(message)}\0{context_hash}".encode("utf-8"), digest_size=16).hexdigest()
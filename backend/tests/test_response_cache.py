@@ -0,0 +1,65 @@
+from services.response_cache import ResponseCache
+
+CONTEXT = "Vendor review notes for the quarterly security audit."
+
+
+def test_exact_repeat_is_served_from_cache():
+    cache = ResponseCache()
+    cache.put("What are the top 3 risks?", CONTEXT, "three risks")
+    
+    assert cache.get("  what are the TOP 3 risks?", CONTEXT) == "three risks"
+
+
+def test_context_is_part_of_the_key():
+    cache = ResponseCache()
+    cache.put("What are the top 3 risks?", CONTEXT, "three risks")
+    
+    assert cache.get("What are the top 3 risks?", "Different retrieved context.") is None
+
+
+# Long questions differing in the one word that matters are lexically near-identical
+AUDIT_QUESTION = (
+    "Given the findings in the attached quarterly vendor risk report, which of our cloud infrastructure "
+    "and managed service vendors {outcome} the annual security audit this year, and what remediation steps "
+    "are still outstanding for each of them before contract renewal in the fourth quarter of the fiscal year?"
+)
+APPROVAL_QUESTION = (
+    "Based on the cost projections, staffing plan, migration timeline and risk assessment in the attached "
+    "documents, should we {decision} the proposed datacenter consolidation budget for the next fiscal year "
+    "and move forward with the vendor selection process as outlined by the infrastructure team?"
+)
+
+
+def test_changed_outcome_word_misses():
+    cache = ResponseCache()
+    cache.put(AUDIT_QUESTION.format(outcome="passed"), CONTEXT, "PASSED LIST")
+    
+    assert cache.get(AUDIT_QUESTION.format(outcome="failed"), CONTEXT) is None
+
+
+def test_negated_question_misses():
+    cache = ResponseCache()
+    cache.put(APPROVAL_QUESTION.format(decision="approve"), CONTEXT, "YES APPROVE")
+    
+    assert cache.get(APPROVAL_QUESTION.format(decision="not approve"), CONTEXT) is None
+
+
+def test_changed_number_and_letter_miss():
+    cache = ResponseCache()
+    cache.put("What are the top 3 risks?", CONTEXT, "three risks")
+    cache.put("What is the status of server A?", CONTEXT, "server A status")
+    
+    assert cache.get("What are the top 5 risks?", CONTEXT) is None
+    assert cache.get("What is the status of server B?", CONTEXT) is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(maxsize=2)
+    cache.put("first", None, "1")
+    cache.put("second", None, "2")
+    cache.get("first")
+    cache.put("third", None, "3")
+    
+    assert cache.get("first") == "1"
+    assert cache.get("second") is None
+    assert cache.get("third") == "3"
@@ -0,0 +1,43 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+class SingleFlightTTLCache:
+    """TTL cache for async computations that coalesces concurrent callers of the same key"""
+    
+    def __init__(self, ttl: float = 300, maxsize: int = 128):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        # key -> (expiry on the monotonic clock, value), oldest first
+        self._values: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+    
+    async def get_or_compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value for key, running compute at most once across concurrent callers"""
+        entry = self._values.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(compute())
+            self._inflight[key] = future
+            future.add_done_callback(lambda f: self._on_done(key, f))
+        
+        # Shield so one cancelled caller does not cancel the shared computation
+        return await asyncio.shield(future)
+    
+    def clear(self):
+        """Drop all cached values"""
+        self._values.clear()
+    
+    def _on_done(self, key: Hashable, future: asyncio.Future):
+        self._inflight.pop(key, None)
+        if future.cancelled() or future.exception() is not None:
+            return
+        
+        self._values[key] = (time.monotonic() + self.ttl, future.result())
+        self._values.move_to_end(key)
+        while len(self._values) > self.maxsize:
+            self._values.popitem(last=False)
@@ -1,87 +1,175 @@
+import os
 import re
 import json
 import logging
-from typing import Dict, List, Any, Optional
+from typing import Dict, Iterator, List, Any, Optional
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# RE2 matches in time linear in the input, so hostile documents cannot trigger catastrophic
+# backtracking; its \w, \d, \s and \b are ASCII-only though, so it is opt-in.
+try:
+    import re2
+except ImportError:
+    re2 = None
+
+USE_RE2 = os.getenv("PARSE_REGEX_ENGINE", "re").lower() == "re2" and re2 is not None
+
+def _compile(pattern: str, flags: int = 0):
+    """Compile an extraction pattern with RE2 when enabled, otherwise with the stdlib engine"""
+    if USE_RE2:
+        # RE2 takes flags inline
+        inline = ('i' if flags & re.IGNORECASE else '') + ('m' if flags & re.MULTILINE else '')
+        try:
+            return re2.compile(f"(?{inline}){pattern}" if inline else pattern)
+        except Exception as e:
+            logger.warning(f"RE2 cannot compile {pattern!r}, using re: {str(e)}")
+    return re.compile(pattern, flags)
+
+# Patterns are compiled once at import rather than looked up in re's cache on every call
+_EMAIL_RE = _compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b')
+_PHONE_RES = tuple(_compile(pattern) for pattern in [
+    r'\b\d{3}-\d{3}-\d{4}\b',  # 123-456-7890
+    r'\b\(\d{3}\)\s*\d{3}-\d{4}\b',  # (123) 456-7890
+    r'\b\d{3}\.\d{3}\.\d{4}\b',  # 123.456.7890
+    r'\b\d{10}\b'  # 1234567890
+])
+_DATE_RES = tuple(_compile(pattern) for pattern in [
+    r'\b\d{1,2}/\d{1,2}/\d{4}\b',  # MM/DD/YYYY
+    r'\b\d{1,2}-\d{1,2}-\d{4}\b',  # MM-DD-YYYY
+    r'\b\d{4}-\d{1,2}-\d{1,2}\b',  # YYYY-MM-DD
+    r'\b[A-Za-z]+ \d{1,2}, \d{4}\b'  # Month DD, YYYY
+])
+_URL_RE = _compile(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+')
+# (literal the pattern cannot match without, pattern)
+_CURRENCY_RES = tuple((literal, _compile(pattern, re.IGNORECASE)) for literal, pattern in [
+    ('$', r'\$\d{1,3}(?:,\d{3})*(?:\.\d{2})?'),  # $1,234.56
+    ('$', r'\$\d+(?:\.\d{2})?'),  # $123.45
+    (None, r'\d{1,3}(?:,\d{3})*(?:\.\d{2})?\s*(?:USD|dollars?)'),  # 1,234.56 USD
+])
+_PERCENT_RE = _compile(r'\d+(?:\.\d+)?%')
+# Text normalisation keeps stdlib Unicode semantics
+_WS_RE = re.compile(r'\s+')
+_PUNCT_RE = re.compile(r'[^\w\s\.\,\!\?\;\:\-\(\)]')
+_KEYPHRASE_RE = _compile(r'\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*\b')
+_NUMBER_RE = _compile(r'\b\d{1,3}(?:,\d{3})*(?:\.\d+)?\b')
+# Every phone, date and number pattern needs a digit; finding none skips those passes
+_DIGIT_RE = re.compile(r'\d')
+# Lines holding a pipe or tab; only these can be table rows
+_TABLE_LINE_RE = re.compile(r'^[^\n]*[|\t][^\n]*$', re.MULTILINE)
+
+# One "label: value" pass for currency, percentage and plain-number metrics; labels are capped
+# at six words so long runs of words cannot backtrack quadratically
+_METRIC_RE = _compile(
+    r'(\w+(?:\s+\w+){0,5})\s*:?\s*'
+    r'(\$\d{1,3}(?:,\d{3})*(?:\.\d{2})?|\d+(?:\.\d+)?%|\d{1,3}(?:,\d{3})*(?:\.\d+)?)',
+    re.IGNORECASE
+)
+_ACTION_PATTERNS = [
+    r'(?:TODO|Action|Task|Follow[- ]up):\s*(.+)',
+    r'(?:•|\*|-)\s*(.+(?:due|by|before).+)',
+    r'(?:Need to|Must|Should|Will)\s+(.+)',
+]
+_DUE_DATE_RE = _compile(r'(?:due|by|before)\s+(.+?)(?:\.|$)', re.IGNORECASE)
+_RISK_PATTERNS = [
+    r'(?:Risk|Issue|Problem|Concern|Challenge):\s*(.+)',
+    r'(?:High|Medium|Low)\s+(?:risk|priority):\s*(.+)',
+    r'(?:Warning|Alert|Critical):\s*(.+)',
+]
+# Lowercased patterns run case-sensitively over the lowercased text; the IGNORECASE
+# originals are needed for non-ASCII text, whose case folding str.lower() does not match
+_ACTION_RES = tuple(_compile(pattern, re.IGNORECASE | re.MULTILINE) for pattern in _ACTION_PATTERNS)
+_ACTION_RES_LC = tuple(_compile(pattern.lower(), re.MULTILINE) for pattern in _ACTION_PATTERNS)
+_RISK_RES = tuple(_compile(pattern, re.IGNORECASE | re.MULTILINE) for pattern in _RISK_PATTERNS)
+_RISK_RES_LC = tuple(_compile(pattern.lower(), re.MULTILINE) for pattern in _RISK_PATTERNS)
+# Severity keywords, matched anywhere in the lowercased risk text; high takes precedence
+_HIGH_SEVERITY_RE = re.compile(r'critical|high|urgent|severe')
+_LOW_SEVERITY_RE = re.compile(r'low|minor|small')
+
+def _case_insensitive_captures(text: str, folded_patterns, patterns) -> Iterator[str]:
+    """Yield each pattern's first group from text, in pattern order, matching without case"""
+    if not text.isascii():
+        # IGNORECASE folds characters str.lower() leaves alone ('ſ' matches 's') and some
+        # characters lowercase to several, so non-ASCII text keeps the original patterns
+        for pattern in patterns:
+            for match in pattern.finditer(text):
+                yield match.group(1)
+        return
+    
+    lower = text.lower()
+    for pattern in folded_patterns:
+        for match in pattern.finditer(lower):
+            # Slice the original so captures keep their case
+            yield text[match.start(1):match.end(1)]
+
 class TextParser:
     """Utility class for parsing and extracting information from text"""
     
     @staticmethod
     def extract_emails(text: str) -> List[str]:
         """Extract email addresses from text"""
-        email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
-        return re.findall(email_pattern, text)
+        if '@' not in text:
+            return []
+        return _EMAIL_RE.findall(text)
     
     @staticmethod
     def extract_phone_numbers(text: str) -> List[str]:
         """Extract phone numbers from text"""
-        phone_patterns = [
-            r'\b\d{3}-\d{3}-\d{4}\b',  # 123-456-7890
-            r'\b\(\d{3}\)\s*\d{3}-\d{4}\b',  # (123) 456-7890
-            r'\b\d{3}\.\d{3}\.\d{4}\b',  # 123.456.7890
-            r'\b\d{10}\b'  # 1234567890
-        ]
+        if not _DIGIT_RE.search(text):
+            return []
         
         phone_numbers = []
-        for pattern in phone_patterns:
-            phone_numbers.extend(re.findall(pattern, text))
+        for pattern in _PHONE_RES:
+            phone_numbers.extend(pattern.findall(text))
         
         return phone_numbers
     
     @staticmethod
     def extract_dates(text: str) -> List[str]:
         """Extract dates from text"""
-        date_patterns = [
-            r'\b\d{1,2}/\d{1,2}/\d{4}\b',  # MM/DD/YYYY
-            r'\b\d{1,2}-\d{1,2}-\d{4}\b',  # MM-DD-YYYY
-            r'\b\d{4}-\d{1,2}-\d{1,2}\b',  # YYYY-MM-DD
-            r'\b[A-Za-z]+ \d{1,2}, \d{4}\b'  # Month DD, YYYY
-        ]
+        if not _DIGIT_RE.search(text):
+            return []
         
         dates = []
-        for pattern in date_patterns:
-            dates.extend(re.findall(pattern, text))
+        for pattern in _DATE_RES:
+            dates.extend(pattern.findall(text))
         
         return dates
     
     @staticmethod
     def extract_urls(text: str) -> List[str]:
         """Extract URLs from text"""
-        url_pattern = r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+'
-        return re.findall(url_pattern, text)
+        if 'http' not in text:
+            return []
+        return _URL_RE.findall(text)
     
     @staticmethod
     def extract_currency(text: str) -> List[str]:
         """Extract currency amounts from text"""
-        currency_patterns = [
-            r'\$\d{1,3}(?:,\d{3})*(?:\.\d{2})?',  # $1,234.56
-            r'\$\d+(?:\.\d{2})?',  # $123.45
-            r'\d{1,3}(?:,\d{3})*(?:\.\d{2})?\s*(?:USD|dollars?)',  # 1,234.56 USD
-        ]
-        
         amounts = []
-        for pattern in currency_patterns:
-            amounts.extend(re.findall(pattern, text, re.IGNORECASE))
+        for literal, pattern in _CURRENCY_RES:
+            if literal is not None and literal not in text:
+                continue
+            amounts.extend(pattern.findall(text))
         
         return amounts
     
     @staticmethod
     def extract_percentages(text: str) -> List[str]:
         """Extract percentages from text"""
-        percentage_pattern = r'\d+(?:\.\d+)?%'
-        return re.findall(percentage_pattern, text)
+        if '%' not in text:
+            return []
+        return _PERCENT_RE.findall(text)
     
     @staticmethod
     def clean_text(text: str) -> str:
         """Clean and normalize text"""
         # Remove extra whitespace
-        text = re.sub(r'\s+', ' ', text)
+        text = _WS_RE.sub(' ', text)
         
         # Remove special characters but keep basic punctuation
-        text = re.sub(r'[^\w\s\.\,\!\?\;\:\-\(\)]', '', text)
+        text = _PUNCT_RE.sub('', text)
         
         # Strip leading/trailing whitespace
         text = text.strip()
@@ -92,7 +180,7 @@ class TextParser:
     def extract_key_phrases(text: str, min_length: int = 3) -> List[str]:
         """Extract potential key phrases from text"""
         # Simple approach: extract capitalized phrases
-        phrases = re.findall(r'\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*\b', text)
+        phrases = _KEYPHRASE_RE.findall(text)
         
         # Filter by minimum length
         return [phrase for phrase in phrases if len(phrase.split()) >= min_length]
@@ -101,8 +189,9 @@ class TextParser:
     def extract_numbers(text: str) -> List[float]:
         """Extract numeric values from text"""
         # Pattern for numbers (including decimals and commas)
-        number_pattern = r'\b\d{1,3}(?:,\d{3})*(?:\.\d+)?\b'
-        number_strings = re.findall(number_pattern, text)
+        if not _DIGIT_RE.search(text):
+            return []
+        number_strings = _NUMBER_RE.findall(text)
         
         numbers = []
         for num_str in number_strings:
@@ -121,11 +210,13 @@ class DataExtractor:
     @staticmethod
     def extract_table_data(text: str) -> List[Dict[str, Any]]:
         """Extract table-like data from text"""
-        lines = text.split('\n')
         table_data = []
+        if '|' not in text and '\t' not in text:
+            return table_data
         
         # Look for lines that might be table headers or rows
-        for line in lines:
+        for match in _TABLE_LINE_RE.finditer(text):
+            line = match.group()
             if '|' in line:  # Pipe-separated values
                 cells = [cell.strip() for cell in line.split('|')]
                 if len(cells) > 1:
@@ -141,29 +232,22 @@ class DataExtractor:
     def extract_metrics(text: str) -> Dict[str, Any]:
         """Extract metrics and KPIs from text"""
         metrics = {}
+        # Every metric value is numeric
+        if not _DIGIT_RE.search(text):
+            return metrics
         
-        # Extract percentages with context
-        percentage_matches = re.finditer(r'(\w+(?:\s+\w+)*)\s*:?\s*(\d+(?:\.\d+)?%)', text, re.IGNORECASE)
-        for match in percentage_matches:
+        numeric = {}
+        for match in _METRIC_RE.finditer(text):
             key = match.group(1).strip().lower().replace(' ', '_')
             value = match.group(2)
-            metrics[key] = value
-        
-        # Extract currency amounts with context
-        currency_matches = re.finditer(r'(\w+(?:\s+\w+)*)\s*:?\s*(\$\d{1,3}(?:,\d{3})*(?:\.\d{2})?)', text, re.IGNORECASE)
-        for match in currency_matches:
-            key = match.group(1).strip().lower().replace(' ', '_')
-            value = match.group(2)
-            metrics[key] = value
-        
-        # Extract numeric values with context
-        numeric_matches = re.finditer(r'(\w+(?:\s+\w+)*)\s*:?\s*(\d{1,3}(?:,\d{3})*(?:\.\d+)?)', text, re.IGNORECASE)
-        for match in numeric_matches:
-            key = match.group(1).strip().lower().replace(' ', '_')
-            value = match.group(2)
-            # Skip if already captured as percentage or currency
-            if key not in metrics:
+            if value[0] == '$' or value[-1] == '%':
                 metrics[key] = value
+            else:
+                numeric.setdefault(key, value)
+        
+        # Plain numbers only fill keys not already captured as percentage or currency
+        for key, value in numeric.items():
+            metrics.setdefault(key, value)
         
         return metrics
     
@@ -173,28 +257,20 @@ class DataExtractor:
         action_items = []
         
         # Look for common action item patterns
-        patterns = [
-            r'(?:TODO|Action|Task|Follow[- ]up):\s*(.+)',
-            r'(?:•|\*|-)\s*(.+(?:due|by|before).+)',
-            r'(?:Need to|Must|Should|Will)\s+(.+)',
-        ]
-        
-        for pattern in patterns:
-            matches = re.finditer(pattern, text, re.IGNORECASE | re.MULTILINE)
-            for match in matches:
-                action_text = match.group(1).strip()
-                
-                # Try to extract due date
-                due_date = None
-                date_match = re.search(r'(?:due|by|before)\s+(.+?)(?:\.|$)', action_text, re.IGNORECASE)
-                if date_match:
-                    due_date = date_match.group(1).strip()
-                
-                action_items.append({
-                    'text': action_text,
-                    'due_date': due_date,
-                    'priority': 'medium'  # Default priority
-                })
+        for capture in _case_insensitive_captures(text, _ACTION_RES_LC, _ACTION_RES):
+            action_text = capture.strip()
+            
+            # Try to extract due date
+            due_date = None
+            date_match = _DUE_DATE_RE.search(action_text)
+            if date_match:
+                due_date = date_match.group(1).strip()
+            
+            action_items.append({
+                'text': action_text,
+                'due_date': due_date,
+                'priority': 'medium'  # Default priority
+            })
         
         return action_items
     
@@ -204,29 +280,22 @@ class DataExtractor:
         risks = []
         
         # Look for risk-related keywords and patterns
-        risk_patterns = [
-            r'(?:Risk|Issue|Problem|Concern|Challenge):\s*(.+)',
-            r'(?:High|Medium|Low)\s+(?:risk|priority):\s*(.+)',
-            r'(?:Warning|Alert|Critical):\s*(.+)',
-        ]
-        
-        for pattern in risk_patterns:
-            matches = re.finditer(pattern, text, re.IGNORECASE | re.MULTILINE)
-            for match in matches:
-                risk_text = match.group(1).strip()
-                
-                # Determine severity based on keywords
-                severity = 'medium'
-                if any(word in risk_text.lower() for word in ['critical', 'high', 'urgent', 'severe']):
-                    severity = 'high'
-                elif any(word in risk_text.lower() for word in ['low', 'minor', 'small']):
-                    severity = 'low'
-                
-                risks.append({
-                    'description': risk_text,
-                    'severity': severity,
-                    'category': 'general'
-                })
+        for capture in _case_insensitive_captures(text, _RISK_RES_LC, _RISK_RES):
+            risk_text = capture.strip()
+            
+            # Determine severity based on keywords
+            severity = 'medium'
+            lower_text = risk_text.lower()
+            if _HIGH_SEVERITY_RE.search(lower_text):
+                severity = 'high'
+            elif _LOW_SEVERITY_RE.search(lower_text):
+                severity = 'low'
+            
+            risks.append({
+                'description': risk_text,
+                'severity': severity,
+                'category': 'general'
+            })
         
         return risks
 
@@ -1,21 +1,53 @@
 import os
+import asyncio
+import hashlib
 import pickle
 import logging
-from typing import List, Dict, Optional
+import threading
+from functools import lru_cache
+from typing import List, Dict, Optional, Tuple
+import msgpack
 import numpy as np
 import faiss
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction.text import HashingVectorizer
 
 logger = logging.getLogger(__name__)
 
+# HNSW graph parameters: neighbours per node, build-time and query-time beam widths.
+# Vectors are stored as 8-bit scalar-quantized codes, a quarter of the float32 footprint.
+HNSW_M = int(os.getenv("VECTOR_STORE_HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("VECTOR_STORE_HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("VECTOR_STORE_HNSW_EF_SEARCH", "64"))
+
+# Hashed term-frequency features: stateless, so vectors stay valid as documents are added
+HASHING_FEATURES = 2 ** 12
+# Chunks are vectorized in batches of this many rows to bound the dense intermediate
+VECTORIZE_BATCH_SIZE = 1024
+
+# Chunk texts and metadata are stored as msgpack; the pickle files are read from older stores
+DOCUMENTS_FILE = "documents.msgpack"
+METADATA_FILE = "metadata.msgpack"
+LEGACY_DOCUMENTS_FILE = "documents.pkl"
+LEGACY_METADATA_FILE = "metadata.pkl"
+LEGACY_VECTORIZER_FILE = "vectorizer.pkl"
+
 class VectorStore:
     def __init__(self, store_path: str = "./vector_store"):
         self.store_path = store_path
         self.index = None
         self.documents = []
         self.metadata = []
-        self.vectorizer = TfidfVectorizer(max_features=1000, stop_words='english')
+        # Content hashes of indexed chunks, so re-uploaded content is not re-indexed
+        self.chunk_hashes = set()
+        # Unit-length, non-negative float32 rows feed the inner-product index directly
+        self.vectorizer = HashingVectorizer(
+            n_features=HASHING_FEATURES, stop_words='english', alternate_sign=False, norm='l2', dtype=np.float32
+        )
         self.is_trained = False
+        # Guards the documents/index pair against concurrent ingestion threads
+        self._lock = threading.RLock()
+        # Memoized query vectors
+        self._query_vector = lru_cache(maxsize=1024)(self._vectorize_query)
         
         # Create store directory if it doesn't exist
         os.makedirs(store_path, exist_ok=True)
@@ -25,27 +57,62 @@ class VectorStore:
     
     def add_document(self, content: str, filename: str, metadata: Optional[Dict] = None):
         """Add a document to the vector store"""
+        self.add_documents_bulk([(content, filename, metadata)])
+    
+    def add_documents_bulk(self, items: List[Tuple[str, str, Optional[Dict]]]):
+        """Add (content, filename, metadata) documents, indexing the new chunks and saving once"""
         try:
             # Split content into chunks
-            chunks = self._chunk_text(content)
+            chunked = [(self._chunk_text(content), filename, metadata) for content, filename, metadata in items]
             
-            for i, chunk in enumerate(chunks):
-                self.documents.append(chunk)
-                chunk_metadata = {
-                    "filename": filename,
-                    "chunk_id": i,
-                    "total_chunks": len(chunks)
-                }
-                if metadata:
-                    chunk_metadata.update(metadata)
+            with self._lock:
+                # Store state is only updated once the new chunks are in the index
+                new_chunks = []
+                new_hashes = set()
+                new_metadata = []
+                for chunks, filename, metadata in chunked:
+                    added = 0
+                    for i, chunk in enumerate(chunks):
+                        chunk_hash = self._chunk_hash(chunk)
+                        if chunk_hash in self.chunk_hashes or chunk_hash in new_hashes:
+                            continue
+                        
+                        new_hashes.add(chunk_hash)
+                        new_chunks.append(chunk)
+                        added += 1
+                        chunk_metadata = {
+                            "filename": filename,
+                            "chunk_id": i,
+                            "total_chunks": len(chunks)
+                        }
+                        if metadata:
+                            chunk_metadata.update(metadata)
+                        
+                        new_metadata.append(chunk_metadata)
+                    
+                    if added == 0:
+                        logger.info(f"All {len(chunks)} chunks from {filename} are already indexed")
+                    else:
+                        logger.info(f"Adding {added} of {len(chunks)} chunks from {filename} to vector store")
                 
-                self.metadata.append(chunk_metadata)
-            
-            # Rebuild index with new documents
-            self._build_index()
-            self._save_index()
+                if not new_chunks:
+                    return
+                
+                # Only the new chunks are vectorized and added to the existing index
+                try:
+                    self._add_to_index(new_chunks)
+                except Exception:
+                    # A partial add leaves the index ahead of the documents; rebuild it from them
+                    self._build_index()
+                    raise
+                
+                self.documents.extend(new_chunks)
+                self.metadata.extend(new_metadata)
+                self.chunk_hashes.update(new_hashes)
+                self._save_index()
+                total_added = len(new_chunks)
             
-            logger.info(f"Added {len(chunks)} chunks from {filename} to vector store")
+            logger.info(f"Added {total_added} chunks from {len(items)} documents to vector store")
         
         except Exception as e:
             logger.error(f"Error adding document to vector store: {str(e)}")
@@ -54,18 +121,19 @@ class VectorStore:
     def search(self, query: str, k: int = 5) -> str:
         """Search for relevant documents"""
         try:
-            if not self.is_trained or len(self.documents) == 0:
-                return "No documents available for search."
-            
-            # Vectorize query
-            query_vector = self.vectorizer.transform([query]).toarray().astype('float32')
-            
-            # Search in FAISS index
-            distances, indices = self.index.search(query_vector, min(k, len(self.documents)))
+            with self._lock:
+                if not self.is_trained or len(self.documents) == 0:
+                    return "No documents available for search."
+                
+                # Vectorize query (repeat queries are served from the LRU)
+                query_vector = self._query_vector(query)
+                
+                # Search in FAISS index
+                distances, indices = self.index.search(query_vector, min(k, len(self.documents)))
             
             # Collect relevant chunks
             relevant_chunks = []
-            for i, idx in enumerate(indices[0]):
+            for idx in indices[0].tolist():
                 if idx != -1:  # Valid index
                     chunk = self.documents[idx]
                     metadata = self.metadata[idx]
@@ -77,8 +145,12 @@ class VectorStore:
             logger.error(f"Error searching vector store: {str(e)}")
             return f"Search error: {str(e)}"
     
+    async def asearch(self, query: str, k: int = 5) -> str:
+        """Search for relevant documents without blocking the event loop"""
+        return await asyncio.to_thread(self.search, query, k)
+    
     def _chunk_text(self, text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
-        """Split text into overlapping chunks"""
+        """Split text into overlapping chunks, preferring sentence boundaries"""
         if len(text) <= chunk_size:
             return [text]
         
@@ -90,11 +162,11 @@ class VectorStore:
             
             # Try to break at sentence boundary
             if end < len(text):
-                # Look for sentence endings
-                for i in range(end, max(start + chunk_size // 2, end - 100), -1):
-                    if text[i] in '.!?':
-                        end = i + 1
-                        break
+                # Last sentence ending in the window (lowest, end]; rfind scans in C
+                lowest = max(start + chunk_size // 2, end - 100)
+                boundary = max(text.rfind(mark, lowest + 1, end + 1) for mark in '.!?')
+                if boundary != -1:
+                    end = boundary + 1
             
             chunk = text[start:end].strip()
             if chunk:
@@ -104,44 +176,78 @@ class VectorStore:
         
         return chunks
     
+    def _vectorize(self, texts: List[str]) -> np.ndarray:
+        """Vectorize texts into a dense float32 matrix of unit-length rows"""
+        return np.ascontiguousarray(self.vectorizer.transform(texts).toarray(), dtype=np.float32)
+    
+    def _vectorize_query(self, query: str) -> np.ndarray:
+        """Vectorize a query"""
+        query_vector = self._vectorize([query])
+        query_vector.setflags(write=False)  # Shared by every cache hit
+        return query_vector
+    
+    @staticmethod
+    def _chunk_hash(chunk: str) -> str:
+        """Content hash identifying a chunk"""
+        return hashlib.blake2b(chunk.encode('utf-8'), digest_size=16).hexdigest()
+    
     def _build_index(self):
         """Build FAISS index from documents"""
         try:
+            self.index = None
+            self.is_trained = False
             if len(self.documents) == 0:
                 return
             
-            # Create TF-IDF vectors
-            vectors = self.vectorizer.fit_transform(self.documents).toarray().astype('float32')
-            
-            # Create FAISS index
-            dimension = vectors.shape[1]
-            self.index = faiss.IndexFlatL2(dimension)
-            self.index.add(vectors)
-            
-            self.is_trained = True
-            logger.info(f"Built FAISS index with {len(self.documents)} documents")
+            self._add_to_index(self.documents)
+            logger.info(f"Built FAISS HNSW index with {len(self.documents)} documents")
         
         except Exception as e:
             logger.error(f"Error building FAISS index: {str(e)}")
             raise
     
+    def _add_to_index(self, chunks: List[str]):
+        """Vectorize chunks and append them to the index, creating it if needed"""
+        if self.index is None:
+            self.index = self._create_index(HASHING_FEATURES)
+        
+        # Create hashed term-frequency vectors
+        for start in range(0, len(chunks), VECTORIZE_BATCH_SIZE):
+            self.index.add(self._vectorize(chunks[start:start + VECTORIZE_BATCH_SIZE]))
+        
+        self.is_trained = True
+    
+    def _create_index(self, dimension: int):
+        """Create an empty cosine-similarity HNSW index over int8 scalar-quantized vectors"""
+        index = faiss.IndexHNSWSQ(dimension, faiss.ScalarQuantizer.QT_8bit, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+        # Hashed unit-length rows lie in [0, 1] in every dimension, so the quantizer is trained
+        # on that fixed range once rather than on the data, and stays valid as vectors are added
+        index.train(np.stack([np.zeros(dimension, dtype=np.float32), np.ones(dimension, dtype=np.float32)]))
+        return index
+    
     def _save_index(self):
         """Save index and metadata to disk"""
         try:
             if self.index is not None:
-                # Save FAISS index
-                faiss.write_index(self.index, os.path.join(self.store_path, "index.faiss"))
+                # Save FAISS index; written aside and renamed so a crash never leaves a partial file
+                index_path = os.path.join(self.store_path, "index.faiss")
+                faiss.write_index(self.index, index_path + ".tmp")
+                os.replace(index_path + ".tmp", index_path)
                 
                 # Save documents and metadata
-                with open(os.path.join(self.store_path, "documents.pkl"), "wb") as f:
-                    pickle.dump(self.documents, f)
+                with open(os.path.join(self.store_path, DOCUMENTS_FILE), "wb") as f:
+                    f.write(msgpack.packb(self.documents))
                 
-                with open(os.path.join(self.store_path, "metadata.pkl"), "wb") as f:
-                    pickle.dump(self.metadata, f)
+                with open(os.path.join(self.store_path, METADATA_FILE), "wb") as f:
+                    f.write(msgpack.packb(self.metadata))
                 
-                # Save vectorizer
-                with open(os.path.join(self.store_path, "vectorizer.pkl"), "wb") as f:
-                    pickle.dump(self.vectorizer, f)
+                # Superseded by the msgpack files and the stateless vectorizer
+                for filename in [LEGACY_DOCUMENTS_FILE, LEGACY_METADATA_FILE, LEGACY_VECTORIZER_FILE]:
+                    legacy_path = os.path.join(self.store_path, filename)
+                    if os.path.exists(legacy_path):
+                        os.remove(legacy_path)
                 
                 logger.info("Saved vector store to disk")
         
@@ -152,26 +258,36 @@ class VectorStore:
         """Load index and metadata from disk"""
         try:
             index_path = os.path.join(self.store_path, "index.faiss")
-            documents_path = os.path.join(self.store_path, "documents.pkl")
-            metadata_path = os.path.join(self.store_path, "metadata.pkl")
-            vectorizer_path = os.path.join(self.store_path, "vectorizer.pkl")
+            documents_path = os.path.join(self.store_path, DOCUMENTS_FILE)
+            metadata_path = os.path.join(self.store_path, METADATA_FILE)
+            legacy = not os.path.exists(documents_path)
+            if legacy:
+                documents_path = os.path.join(self.store_path, LEGACY_DOCUMENTS_FILE)
+                metadata_path = os.path.join(self.store_path, LEGACY_METADATA_FILE)
             
-            if all(os.path.exists(path) for path in [index_path, documents_path, metadata_path, vectorizer_path]):
-                # Load FAISS index
+            if all(os.path.exists(path) for path in [index_path, documents_path, metadata_path]):
                 self.index = faiss.read_index(index_path)
+                if hasattr(self.index, "hnsw"):
+                    self.index.hnsw.efSearch = HNSW_EF_SEARCH
                 
                 # Load documents and metadata
+                load = pickle.load if legacy else (lambda f: msgpack.unpackb(f.read()))
                 with open(documents_path, "rb") as f:
-                    self.documents = pickle.load(f)
+                    self.documents = load(f)
                 
                 with open(metadata_path, "rb") as f:
-                    self.metadata = pickle.load(f)
+                    self.metadata = load(f)
                 
-                # Load vectorizer
-                with open(vectorizer_path, "rb") as f:
-                    self.vectorizer = pickle.load(f)
+                self.chunk_hashes = {self._chunk_hash(doc) for doc in self.documents}
                 
                 self.is_trained = True
+                
+                # Indexes built from fitted TF-IDF vectors are re-indexed with the hashing vectorizer
+                if self.index.d != HASHING_FEATURES or self.index.ntotal != len(self.documents):
+                    logger.info("Re-indexing vector store with hashed features")
+                    self._build_index()
+                    self._save_index()
+                
                 logger.info(f"Loaded vector store with {len(self.documents)} documents")
         
         except Exception as e:
@@ -180,6 +296,7 @@ class VectorStore:
             self.index = None
             self.documents = []
             self.metadata = []
+            self.chunk_hashes = set()
             self.is_trained = False
     
     def clear(self):
@@ -188,10 +305,11 @@ class VectorStore:
             self.index = None
             self.documents = []
             self.metadata = []
+            self.chunk_hashes = set()
             self.is_trained = False
             
             # Remove saved files
-            for filename in ["index.faiss", "documents.pkl", "metadata.pkl", "vectorizer.pkl"]:
+            for filename in ["index.faiss", DOCUMENTS_FILE, METADATA_FILE, LEGACY_DOCUMENTS_FILE, LEGACY_METADATA_FILE, LEGACY_VECTORIZER_FILE]:
                 file_path = os.path.join(self.store_path, filename)
                 if os.path.exists(file_path):
                     os.remove(file_path)
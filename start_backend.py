@@ -29,7 +29,10 @@ def main():
             "backend.main:app",
             host="0.0.0.0",
             port=8000,
-            reload=True,
+            loop="auto",
+            http="auto",
+            workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+            reload=os.getenv("DEV", "false").lower() == "true",
             log_level="info"
         )
         